@@ -0,0 +1,44 @@
+from bisect import bisect_left
+from typing import List
+
+# Log-spaced bucket upper bounds in microseconds, 16 per decade from 1us to 10s
+BUCKET_BOUNDS_US: List[int] = sorted({round(10 ** (i / 16)) for i in range(7 * 16 + 1)})
+
+class LatencyHistogram:
+    """
+    Fixed-size latency histogram. Recording a sample is a single bucket increment,
+    so memory and per-sample cost do not grow with the number of orders.
+    """
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(BUCKET_BOUNDS_US) + 1)  # Last bucket catches overflow
+        self.total_us = 0
+        self.count = 0
+
+    def record(self, latency_us: int):
+        """Record one latency sample in whole microseconds"""
+        self.counts[bisect_left(BUCKET_BOUNDS_US, latency_us)] += 1
+        self.total_us += latency_us
+        self.count += 1
+
+    def merge(self, other: "LatencyHistogram"):
+        """Fold another histogram's samples into this one"""
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.total_us += other.total_us
+        self.count += other.count
+
+    def mean(self) -> float:
+        """Exact mean latency in microseconds"""
+        return self.total_us / self.count if self.count else 0.0
+
+    def percentile(self, p: float) -> int:
+        """Upper bound (in microseconds) of the bucket holding the p-th percentile"""
+        if not self.count:
+            return 0
+        target = max(1, -(-self.count * p // 100))  # ceil without floats on the count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return BUCKET_BOUNDS_US[min(i, len(BUCKET_BOUNDS_US) - 1)]
+        return BUCKET_BOUNDS_US[-1]
@@ -1,19 +1,24 @@
-from dataclasses import dataclass
-from enum import Enum
-from datetime import datetime
+from dataclasses import dataclass, field
+from enum import IntEnum
 from typing import Optional
 
-class Side(Enum):
-    BUY = "BUY"
-    SELL = "SELL"
+TICK = 10000  # Price ticks per unit; books key levels by integer ticks rather than floats
 
-class OrderStatus(Enum):
-    NEW = "NEW"
-    PARTIALLY_FILLED = "PARTIALLY_FILLED"
-    FILLED = "FILLED"
-    CANCELLED = "CANCELLED"
+def to_ticks(price: float) -> int:
+    """Convert a wire/display price to integer ticks"""
+    return round(price * TICK)
 
-@dataclass
+class Side(IntEnum):
+    BUY = 0
+    SELL = 1
+
+class OrderStatus(IntEnum):
+    NEW = 0
+    PARTIALLY_FILLED = 1
+    FILLED = 2
+    CANCELLED = 3
+
+@dataclass(slots=True)
 class Order:
     order_id: str
     symbol: str
@@ -22,75 +27,27 @@ class Order:
     quantity: float
     remaining_quantity: float
     status: OrderStatus
-    timestamp: datetime
+    timestamp: int  # Nanoseconds since the epoch, from time.time_ns()
     user_id: str
     engine_id: str
-    
-# common/orderbook.py
-from typing import Dict, List
-from collections import defaultdict
-from .order import Order, Side
+    price_ticks: int = field(init=False)  # Derived from price, used for all book keys and comparisons
+
+    def __post_init__(self):
+        self.price_ticks = to_ticks(self.price)
+
+@dataclass(slots=True)
+class Fill:
+    fill_id: int  # Sequence number, unique within the order book that produced it
+    buy_order_id: str
+    sell_order_id: str
+    price: float
+    quantity: float
+    timestamp: int
 
-class OrderBook:
-    def __init__(self, symbol: str):
-        self.symbol = symbol
-        self.bids: Dict[float, List[Order]] = defaultdict(list)
-        self.asks: Dict[float, List[Order]] = defaultdict(list)
-        
-    def add_order(self, order: Order) -> List[Order]:
-        """Add order to book and return list of fills"""
-        fills = []
-        if order.side == Side.BUY:
-            # Match against asks
-            for price in sorted(self.asks.keys()):
-                if price > order.price or order.remaining_quantity <= 0:
-                    break
-                fills.extend(self._match_order_at_price(order, price))
-        else:
-            # Match against bids
-            for price in sorted(self.bids.keys(), reverse=True):
-                if price < order.price or order.remaining_quantity <= 0:
-                    break
-                fills.extend(self._match_order_at_price(order, price))
-                
-        # Add remaining quantity to book
-        if order.remaining_quantity > 0:
-            if order.side == Side.BUY:
-                self.bids[order.price].append(order)
-            else:
-                self.asks[order.price].append(order)
-                
-        return fills
-    
-    def _match_order_at_price(self, incoming_order: Order, price: float) -> List[Order]:
-        fills = []
-        orders = self.bids[price] if incoming_order.side == Side.SELL else self.asks[price]
-        
-        for resting_order in orders[:]:
-            fill_qty = min(incoming_order.remaining_quantity, resting_order.remaining_quantity)
-            if fill_qty <= 0:
-                continue
-                
-            # Update quantities
-            incoming_order.remaining_quantity -= fill_qty
-            resting_order.remaining_quantity -= fill_qty
-            
-            # Create fill records
-            fills.append(Order(
-                order_id=f"fill_{incoming_order.order_id}_{resting_order.order_id}",
-                symbol=incoming_order.symbol,
-                side=incoming_order.side,
-                price=price,
-                quantity=fill_qty,
-                remaining_quantity=0,
-                status=OrderStatus.FILLED,
-                timestamp=datetime.now(),
-                user_id=incoming_order.user_id,
-                engine_id=incoming_order.engine_id
-            ))
-            
-            # Remove filled orders
-            if resting_order.remaining_quantity <= 0:
-                orders.remove(resting_order)
-                
-        return fills
\ No newline at end of file
+@dataclass(slots=True)
+class Bbo:
+    """Global best bid/offer for one symbol in ticks and the peer address holding each side (None if local)"""
+    bid_px: Optional[int]
+    bid_eid: Optional[str]
+    ask_px: Optional[int]
+    ask_eid: Optional[str]
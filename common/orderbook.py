@@ -1,118 +1,192 @@
-from datetime import datetime
-from typing import Dict, List
-from collections import defaultdict
-from .order import Order, Side, OrderStatus
+import itertools
+import time
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Set, Tuple
+from collections import deque
+from sortedcontainers import SortedDict
+from .order import TICK, Fill, Order, Side, to_ticks
 
 class OrderBook:
     def __init__(self, symbol: str):
         self.symbol = symbol
-        self.bids: Dict[float, List[Order]] = defaultdict(list)  # Buy orders, sorted descending by price
-        self.asks: Dict[float, List[Order]] = defaultdict(list)  # Sell orders, sorted ascending by price
+        # Levels are keyed by integer price ticks (see common.order.TICK)
+        self.bids: Dict[int, Deque[Order]] = SortedDict()  # Buy orders, best bid is the last key
+        self.asks: Dict[int, Deque[Order]] = SortedDict()  # Sell orders, best ask is the first key
+        self.bid_qty: Dict[int, float] = {}  # Resting quantity per bid price level
+        self.ask_qty: Dict[int, float] = {}  # Resting quantity per ask price level
+        self.dirty_bids: Set[int] = set()  # Bid levels touched since the last pop_dirty_levels()
+        self.dirty_asks: Set[int] = set()  # Ask levels touched since the last pop_dirty_levels()
+        self._fill_seq = itertools.count(1)
+        self.version = 0  # Bumped on every mutation so readers can tell whether a cached view is current
     
-    def add_order(self, order: Order) -> List[Order]:
+    @property
+    def best_bid(self) -> Optional[int]:
+        """Highest resting bid price in ticks, or None if there are no bids"""
+        return self.bids.peekitem(-1)[0] if self.bids else None
+
+    @property
+    def best_ask(self) -> Optional[int]:
+        """Lowest resting ask price in ticks, or None if there are no asks"""
+        return self.asks.peekitem(0)[0] if self.asks else None
+
+    def add_order(self, order: Order) -> List[Fill]:
         """
         Add an order to the order book and attempt to match it.
         """
         fills = []
+        now = time.time_ns()  # Every fill of this order belongs to the same match event
+        self.version += 1
 
         if order.side == Side.BUY:
             # Match with asks
             while order.remaining_quantity > 0 and self.asks:
-                best_ask_price = min(self.asks.keys())  # Lowest ask price
-                if order.price < best_ask_price:
+                best_ask_price = self.asks.peekitem(0)[0]  # Lowest ask price
+                if order.price_ticks < best_ask_price:
                     break  # No match possible
 
                 # Match with the best ask orders
                 best_ask_orders = self.asks[best_ask_price]
-                for ask_order in best_ask_orders[:]:  # Copy to avoid modification during iteration
+                self.dirty_asks.add(best_ask_price)
+                while best_ask_orders and order.remaining_quantity > 0:
+                    ask_order = best_ask_orders[0]  # Oldest order at this price
                     match_quantity = min(order.remaining_quantity, ask_order.remaining_quantity)
 
                     # Record the fill
-                    fills.append(Order(
-                        order_id=ask_order.order_id,
-                        symbol=order.symbol,
-                        side="SELL",
-                        price=best_ask_price,
+                    fills.append(Fill(
+                        fill_id=next(self._fill_seq),
+                        buy_order_id=order.order_id,
+                        sell_order_id=ask_order.order_id,
+                        price=best_ask_price / TICK,
                         quantity=match_quantity,
-                        remaining_quantity=ask_order.remaining_quantity - match_quantity,
-                        user_id=ask_order.user_id,
-                        status=OrderStatus.FILLED if ask_order.remaining_quantity == match_quantity else OrderStatus.PARTIALLY_FILLED,
-                        timestamp=datetime.now(),
-                        engine_id=ask_order.engine_id
+                        timestamp=now
                     ))
 
                     # Update quantities
                     order.remaining_quantity -= match_quantity
                     ask_order.remaining_quantity -= match_quantity
+                    self.ask_qty[best_ask_price] -= match_quantity
 
-                    # Remove fully filled ask orders
-                    if ask_order.remaining_quantity == 0:
-                        best_ask_orders.remove(ask_order)
-
-                    if order.remaining_quantity == 0:
-                        break
+                    # Remove fully filled ask orders from the front of the queue
+                    if ask_order.remaining_quantity <= 0:
+                        best_ask_orders.popleft()
 
                 # Remove the price level if all orders are filled
                 if not best_ask_orders:
                     del self.asks[best_ask_price]
+                    del self.ask_qty[best_ask_price]
 
         elif order.side == Side.SELL:
             # Match with bids
             while order.remaining_quantity > 0 and self.bids:
-                best_bid_price = max(self.bids.keys())  # Highest bid price
-                if order.price > best_bid_price:
+                best_bid_price = self.bids.peekitem(-1)[0]  # Highest bid price
+                if order.price_ticks > best_bid_price:
                     break  # No match possible
 
                 # Match with the best bid orders
                 best_bid_orders = self.bids[best_bid_price]
-                for bid_order in best_bid_orders[:]:
+                self.dirty_bids.add(best_bid_price)
+                while best_bid_orders and order.remaining_quantity > 0:
+                    bid_order = best_bid_orders[0]  # Oldest order at this price
                     match_quantity = min(order.remaining_quantity, bid_order.remaining_quantity)
 
                     # Record the fill
-                    fills.append(Order(
-                        order_id=bid_order.order_id,
-                        symbol=order.symbol,
-                        side="BUY",
-                        price=best_bid_price,
+                    fills.append(Fill(
+                        fill_id=next(self._fill_seq),
+                        buy_order_id=bid_order.order_id,
+                        sell_order_id=order.order_id,
+                        price=best_bid_price / TICK,
                         quantity=match_quantity,
-                        remaining_quantity=bid_order.remaining_quantity - match_quantity,
-                        user_id=bid_order.user_id,
-                        status=OrderStatus.FILLED if bid_order.remaining_quantity == match_quantity else OrderStatus.PARTIALLY_FILLED,
-                        timestamp=datetime.now(),
-                        engine_id=bid_order.engine_id
+                        timestamp=now
                     ))
 
                     # Update quantities
                     order.remaining_quantity -= match_quantity
                     bid_order.remaining_quantity -= match_quantity
+                    self.bid_qty[best_bid_price] -= match_quantity
 
-                    # Remove fully filled bid orders
-                    if bid_order.remaining_quantity == 0:
-                        best_bid_orders.remove(bid_order)
-
-                    if order.remaining_quantity == 0:
-                        break
+                    # Remove fully filled bid orders from the front of the queue
+                    if bid_order.remaining_quantity <= 0:
+                        best_bid_orders.popleft()
 
                 # Remove the price level if all orders are filled
                 if not best_bid_orders:
                     del self.bids[best_bid_price]
+                    del self.bid_qty[best_bid_price]
 
         # Add the remaining unmatched portion of the order to the book
         if order.remaining_quantity > 0:
-            target_book = self.bids if order.side == Side.BUY else self.asks
-            if order.price not in target_book:
-                target_book[order.price] = []
-            target_book[order.price].append(order)
+            target_book, level_qty, dirty = ((self.bids, self.bid_qty, self.dirty_bids) if order.side == Side.BUY
+                                             else (self.asks, self.ask_qty, self.dirty_asks))
+            price = order.price_ticks
+            dirty.add(price)
+            if price not in target_book:
+                target_book[price] = deque()
+                level_qty[price] = 0
+            target_book[price].append(order)
+            level_qty[price] += order.remaining_quantity
             # print(f"Order {order.order_id} added to {'bids' if order.side == Side.BUY else Side.SELL} at price {order.price}. Remaining quantity: {order.remaining_quantity}")
 
-        # Debug: Print current order book state
-        # print(f"Current bids: {self._get_order_book_summary(self.bids)}")
-        # print(f"Current asks: {self._get_order_book_summary(self.asks)}")
-
         return fills
 
-    def _get_order_book_summary(self, book: Dict[float, List[Order]]) -> Dict[float, int]:
+    def cancel_order(self, order: Order) -> bool:
+        """
+        Remove a resting order from its price level. Returns False if the order is not on the book.
+        """
+        target_book, level_qty, dirty = ((self.bids, self.bid_qty, self.dirty_bids) if order.side == Side.BUY
+                                         else (self.asks, self.ask_qty, self.dirty_asks))
+        price = order.price_ticks
+        orders = target_book.get(price)
+        if orders is None:
+            return False
+        try:
+            orders.remove(order)
+        except ValueError:
+            return False
+
+        level_qty[price] -= order.remaining_quantity
+        dirty.add(price)
+        self.version += 1
+        if not orders:
+            del target_book[price]
+            del level_qty[price]
+        return True
+
+    def pop_dirty_levels(self) -> Tuple[List[tuple], List[tuple]]:
+        """
+        Return (price_ticks, quantity, order_count) for every level touched since the last call and reset
+        the dirty sets. A level that has emptied is reported with zero quantity so peers can drop it.
+        """
+        bids = [(price, self.bid_qty.get(price, 0), len(self.bids.get(price, ()))) for price in self.dirty_bids]
+        asks = [(price, self.ask_qty.get(price, 0), len(self.asks.get(price, ()))) for price in self.dirty_asks]
+        self.dirty_bids.clear()
+        self.dirty_asks.clear()
+        return bids, asks
+
+    def _get_order_book_summary(self, side: Side) -> Dict[float, float]:
         """
-        Summarizes the order book with price levels and total quantities for debugging.
+        Summarizes one side of the order book with price levels and total quantities for debugging.
         """
-        return {price: sum(order.remaining_quantity for order in orders) for price, orders in book.items()}
+        if side == Side.BUY:
+            return {price / TICK: self.bid_qty[price] for price in reversed(self.bids)}
+        return {price / TICK: self.ask_qty[price] for price in self.asks}
+
+    def __repr__(self) -> str:
+        return (f"OrderBook({self.symbol}, bids={self._get_order_book_summary(Side.BUY)}, "
+                f"asks={self._get_order_book_summary(Side.SELL)})")
+
+
+@dataclass(slots=True)
+class PeerBookView:
+    """Aggregate price levels of a peer's book, best price first, with no per-order objects"""
+    symbol: str
+    bids: List[Tuple[int, float, int]]  # (price_ticks, quantity, order_count), highest price first
+    asks: List[Tuple[int, float, int]]  # (price_ticks, quantity, order_count), lowest price first
+
+    @classmethod
+    def from_proto(cls, book) -> "PeerBookView":
+        """Build a view from a pb2.OrderBook, skipping empty levels"""
+        bids = sorted(((to_ticks(level.price), level.quantity, level.order_count)
+                       for level in book.bids if level.quantity > 0), reverse=True)
+        asks = sorted((to_ticks(level.price), level.quantity, level.order_count)
+                      for level in book.asks if level.quantity > 0)
+        return cls(book.symbol, bids, asks)
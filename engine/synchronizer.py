@@ -1,321 +1,486 @@
 import asyncio
+import itertools
+import logging
 import time
-from typing import Dict, List, Set, Optional
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Optional, Sequence, Tuple
 import grpc
 import grpc.aio
 
-from common.order import Order, OrderStatus, Side
-from common.orderbook import OrderBook
+from common.order import TICK, Bbo, Order, OrderStatus, Side, to_ticks
+from common.orderbook import OrderBook, PeerBookView
 import proto.matching_service_pb2 as pb2
 import proto.matching_service_pb2_grpc as pb2_grpc
 
+logger = logging.getLogger(__name__)
+
+MAX_BATCH = 64  # Upper bound on queued updates folded into one broadcast message or stream write
+FULL_SNAPSHOT_EVERY = 100  # Every K-th publish per symbol goes out as a full snapshot so peers resync
+PEER_BOOK_TTL_S = 1.0  # A peer mirror older than this is re-fetched before computing global best prices
+
+SYNC_STREAM_METHOD = '/matching.MatchingService/SyncOrderBookStream'
+
+# Peer channel options: a local subchannel pool gives every channel its own HTTP/2 connection,
+# keepalive pings catch dead peers without reconnect storms, and a larger lookahead window
+# keeps flow control from gating bursts of broadcasts
+CHANNEL_OPTIONS = [
+    ('grpc.use_local_subchannel_pool', 1),
+    ('grpc.keepalive_time_ms', 10000),
+    ('grpc.keepalive_timeout_ms', 5000),
+    ('grpc.keepalive_permit_without_calls', 1),
+    ('grpc.http2.max_pings_without_data', 0),
+    ('grpc.http2.min_time_between_pings_ms', 10000),
+    ('grpc.http2.lookahead_bytes', 1 << 20),
+    ('grpc.http2.write_buffer_size', 1 << 20),
+    ('grpc.max_send_message_length', 16 << 20),
+]
+
 class OrderBookSynchronizer:
-    def __init__(self, engine_id: str, peer_addresses: List[str]):
+    def __init__(self, engine_id: str, peer_addresses: List[str], channels_per_peer: int = 2,
+                 address: str = "", compression: Optional[grpc.Compression] = None):
         self.engine_id = engine_id
+        self.address = address  # Our own server address, sent with updates so peers can route to us
         self.peer_addresses = peer_addresses
+        self.channels_per_peer = channels_per_peer
+        # Off by default: on loopback or a LAN the CPU spent compressing small deltas outweighs the bytes saved
+        self.compression = compression
         self.sequence_number = 0
-        self.update_queue = asyncio.Queue()
+        # Published updates waiting for _sync_loop; the event wakes it once per burst, not per update
+        self._pending: Deque[dict] = deque()
+        self._wakeup = asyncio.Event()
+        # symbol -> {'bids'/'asks': {price_ticks: (quantity, order_count)}} as peers last had it
+        self._last_sent: Dict[str, Dict[str, Dict[int, Tuple[float, int]]]] = {}
+        self._publishes_since_snapshot: Dict[str, int] = {}
+        # Serialized batches waiting for each peer's stream writer; FIFO per peer keeps deltas in order
+        self.peer_queues: Dict[str, asyncio.Queue] = {}
+        self._tasks: List[asyncio.Task] = []  # Sync loop, stream writers and channel watchers, cancelled by stop()
         self.peer_stubs: Dict[str, pb2_grpc.MatchingServiceStub] = {}
-        self.known_orders: Set[str] = set()
+        self.stub_pools: Dict[str, List[pb2_grpc.MatchingServiceStub]] = {}  # Round-robin stubs per peer
+        # SyncOrderBookStream opener per peer that takes already-serialized bytes
+        self.sync_stream_methods: Dict[str, grpc.aio.StreamUnaryMultiCallable] = {}
+        self.channels: List[grpc.aio.Channel] = []
+        self.peer_channels: List[Tuple[str, grpc.aio.Channel]] = []
+        self._rr: Dict[str, Iterator[int]] = {}  # Round-robin position per peer, so fan-outs don't pin peers to one channel
         self.running = False
-        self.lock = asyncio.Lock()
-        self.global_best_prices: Dict[str, Dict[str, Optional[float]]] = {}
+        self.global_best_prices: Dict[str, Bbo] = {}
+        # (peer address, symbol) -> {'bids'/'asks': {price_ticks: (quantity, order_count)}}, fed by peer pushes
+        self.peer_books: Dict[Tuple[str, str], Dict[str, Dict[int, Tuple[float, int]]]] = {}
+        self.peer_book_synced: Dict[Tuple[str, str], float] = {}  # Monotonic time each mirror was last refreshed
+        # (peer address, symbol) -> (best bid, best ask) in ticks, kept in step with peer_books as updates land
+        self.peer_bests: Dict[Tuple[str, str], Tuple[Optional[int], Optional[int]]] = {}
+        self._req_cache: Dict[str, pb2.GetOrderBookRequest] = {}  # Requests are never mutated, so one per symbol
 
     async def start(self):
         """Start the synchronizer"""
         await self._connect_to_peers()
         self.running = True
-        asyncio.create_task(self._sync_loop())
-        print(f"Synchronizer {self.engine_id} started")
+        self._tasks.append(asyncio.create_task(self._sync_loop()))
+        self._tasks += [asyncio.create_task(self._peer_writer(address)) for address in self.sync_stream_methods]
+        self._tasks += [asyncio.create_task(self._watch_channel(address, channel))
+                               for address, channel in self.peer_channels]
+        logger.info("Synchronizer %s started", self.engine_id)
 
     async def stop(self):
         """Stop the synchronizer"""
         self.running = False
+        for task in self._tasks:
+            task.cancel()
+        # Wait for the tasks to actually finish before their channels go away
+        await asyncio.gather(*self._tasks, return_exceptions=True)
         # Close all gRPC channels
-        for stub in self.peer_stubs.values():
-            if hasattr(stub, '_channel'):
-                await stub._channel.close()
+        await asyncio.gather(*(channel.close() for channel in self.channels))
 
     async def _connect_to_peers(self):
         """Establish async gRPC connections to peer engines"""
         for address in self.peer_addresses:
             try:
-                channel = grpc.aio.insecure_channel(address)
-                self.peer_stubs[address] = pb2_grpc.MatchingServiceStub(channel)
+                channels = [
+                    grpc.aio.insecure_channel(address, options=CHANNEL_OPTIONS, compression=self.compression)
+                    for _ in range(self.channels_per_peer)
+                ]
+                self.channels.extend(channels)
+                self.peer_channels.extend((address, channel) for channel in channels)
+                self.stub_pools[address] = [pb2_grpc.MatchingServiceStub(channel) for channel in channels]
+                self.peer_stubs[address] = self.stub_pools[address][0]
+                self._rr[address] = itertools.count()
+                # No request serializer: the broadcast hands over bytes it serialized once for all peers
+                self.sync_stream_methods[address] = channels[0].stream_unary(
+                    SYNC_STREAM_METHOD, request_serializer=None, response_deserializer=pb2.Empty.FromString)
+                self.peer_queues[address] = asyncio.Queue()
             except Exception as e:
-                print(f"Failed to connect to peer at {address}: {e}")
+                logger.error("Failed to connect to peer at %s: %s", address, e)
+
+    async def _watch_channel(self, address: str, channel: grpc.aio.Channel):
+        """Report a peer channel dropping out of and back into service, so reconnects are visible"""
+        ready = grpc.ChannelConnectivity.READY
+        state = channel.get_state(try_to_connect=True)
+        dropped = False  # Startup's IDLE -> CONNECTING -> READY is not worth reporting
+        try:
+            while self.running:
+                await channel.wait_for_state_change(state)
+                new_state = channel.get_state()
+                if state == ready or dropped:
+                    logger.warning("Channel to %s: %s -> %s", address, state.name, new_state.name)
+                    dropped = new_state != ready
+                state = new_state
+        except Exception:
+            pass  # The channel was closed underneath us on shutdown
+
+    def _next_stub(self, address: str) -> pb2_grpc.MatchingServiceStub:
+        """Pick the next stub for a peer, spreading RPCs across its channel pool"""
+        pool = self.stub_pools[address]
+        return pool[next(self._rr[address]) % len(pool)]
+
+    def spawn(self, coro) -> asyncio.Task:
+        """Run a background coroutine whose lifetime is tied to this synchronizer; stop() cancels and awaits it"""
+        task = asyncio.create_task(coro)
+        self._tasks.append(task)
+        return task
+
+    def has_peer(self, address: str) -> bool:
+        """Whether address is one of this synchronizer's connected peers"""
+        return address in self.stub_pools
+
+    async def forward_order(self, address: str, request: pb2.Order, metadata=None) -> pb2.SubmitOrderResponse:
+        """Submit a wire order to a peer engine and return its response"""
+        return await self._next_stub(address).SubmitOrder(request, metadata=metadata)
 
     async def _sync_loop(self):
         """Main synchronization loop"""
         while self.running:
             try:
-                # Get next update from queue
-                update = await self.update_queue.get()
+                # Sleep until something is published, then drain everything pending in MAX_BATCH chunks
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                pending = self._pending
+                while pending:
+                    updates = [pending.popleft() for _ in range(min(len(pending), MAX_BATCH))]
+                    try:
+                        self._broadcast_batch(updates)
+                    except Exception as e:
+                        logger.error("Error broadcasting update: %s", e)
 
-                try:
-                    await self._broadcast_update(update)
-                    self.update_queue.task_done()
-                except Exception as e:
-                    print(f"Error broadcasting update: {e}")
-                    self.update_queue.task_done()
-
-                try:
-                    await self._process_peer_updates()
-                    await asyncio.sleep(0.1)
-                except Exception as e:
-                    print(f"Error processing peer updates: {e}")
-                
             except Exception as e:
-                print(f"Sync error: {e}")
+                logger.error("Sync error: %s", e)
                 await asyncio.sleep(1)
 
-    async def _broadcast_update(self, update: dict):
-        """Broadcast update to all peer engines"""
-        pb_update = pb2.OrderBookUpdate(
-            symbol=update['symbol'],
-            sequence_number=self.sequence_number,
-            engine_id=self.engine_id,
-            bids=[pb2.PriceLevel(
-                price=price,
-                quantity=qty,
-                order_count=count
-            ) for price, qty, count in update['bids']],
-            asks=[pb2.PriceLevel(
-                price=price,
-                quantity=qty,
-                order_count=count
-            ) for price, qty, count in update['asks']]
-        )
-
-        # Broadcast to all peers
-        tasks = []
-        for address, stub in self.peer_stubs.items():
-            try:
-                tasks.append(stub.SyncOrderBook(pb_update))
-            except Exception as e:
-                print(f"Error creating broadcast task for {address}: {e}")
-
-        if tasks:
-            # Wait for all broadcasts to complete
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            for result in results:
-                if isinstance(result, Exception):
-                    print(f"Broadcast error: {result}")
-
-    async def _process_peer_updates(self):
-        """Process incoming updates from peer engines"""
-        async with self.lock:
-            for address, stub in self.peer_stubs.items():
+    def _fill_pb_update(self, pb_update: pb2.OrderBookUpdate, update: dict):
+        """Write a queued update into a wire message in place, building levels with add() to avoid copies"""
+        pb_update.symbol = update['symbol']
+        pb_update.sequence_number = update['sequence_number']
+        pb_update.engine_id = self.engine_id
+        pb_update.address = self.address
+        pb_update.delta = update['delta']
+        add_bid = pb_update.bids.add
+        for price, qty, count in update['bids']:
+            add_bid(price=price / TICK, quantity=qty, order_count=count)
+        add_ask = pb_update.asks.add
+        for price, qty, count in update['asks']:
+            add_ask(price=price / TICK, quantity=qty, order_count=count)
+
+    @staticmethod
+    def _coalesce(updates: List[dict]) -> List[dict]:
+        """
+        Collapse a drained batch to one update per symbol. A full snapshot supersedes everything
+        before it; later deltas are folded into the earlier update level by level, newest winning.
+        The merged update carries the newest sequence number.
+        """
+        latest: Dict[str, dict] = {}
+        for update in updates:
+            prev = latest.get(update['symbol'])
+            if prev is None or not update['delta']:
+                latest[update['symbol']] = update
+                continue
+            merged = dict(update, delta=prev['delta'])
+            for side in ('bids', 'asks'):
+                levels = {level[0]: level for level in prev[side]}
+                levels.update((level[0], level) for level in update[side])
+                if prev['delta']:
+                    merged[side] = list(levels.values())
+                else:
+                    # Applying a delta to a snapshot leaves a snapshot, which only lists live levels
+                    merged[side] = [level for level in levels.values() if level[1] > 0]
+            latest[update['symbol']] = merged
+        return list(latest.values())
+
+    def _broadcast_batch(self, updates: List[dict]):
+        """Hand a batch of updates to every peer's stream writer"""
+        coalesced = self._coalesce(updates) if len(updates) > 1 else updates
+        # Built and serialized once; every peer's stream gets the same bytes
+        batch = pb2.BatchOrderBookUpdate()
+        for update in coalesced:
+            self._fill_pb_update(batch.updates.add(), update)
+        payload = batch.SerializeToString()
+
+        for queue in self.peer_queues.values():
+            queue.put_nowait(payload)
+
+    async def _peer_writer(self, address: str):
+        """
+        Feed one peer's persistent SyncOrderBookStream from its queue. Whatever piles up while a
+        write is in flight goes out as the next single write. If the stream breaks it is reopened
+        for the next batch; the peer re-fetches a mirror that goes stale.
+        """
+        queue = self.peer_queues[address]
+        call = None
+        try:
+            while self.running:
+                payload = await queue.get()
+                if not queue.empty():
+                    # Serialized messages concatenate into one whose repeated updates are all of them, in order
+                    chunks = [payload]
+                    while not queue.empty() and len(chunks) < MAX_BATCH:
+                        chunks.append(queue.get_nowait())
+                    payload = b''.join(chunks)
                 try:
-                    # Get updates from peer
-                    request = pb2.GetOrderBookRequest()
-                    updates = await stub.GetOrderBook(request)
-                    
-                    # Process each update
-                    if hasattr(updates, 'sequence_number') and updates.sequence_number > self.sequence_number:
-                        await self._apply_update(updates)
-                            
+                    if call is None:
+                        call = self.sync_stream_methods[address]()
+                    await call.write(payload)
                 except Exception as e:
-                    print(f"Error processing updates from {address}: {e}")
-
-    async def _apply_update(self, update):
-        """Apply an order book update from a peer"""
-        async with self.lock:
-            # Update sequence number
-            self.sequence_number = max(self.sequence_number, update.sequence_number)
-            
-            # Add to known orders if it's an order update
-            if hasattr(update, 'order_id') and update.order_id not in self.known_orders:
-                self.known_orders.add(update.order_id)
-                
-                # Convert protobuf update to internal format
-                order = Order(
-                    order_id=update.order_id,
-                    symbol=update.symbol,
-                    side=update.side,
-                    price=update.price,
-                    quantity=update.quantity,
-                    remaining_quantity=update.quantity,
-                    status=OrderStatus.NEW,
-                    timestamp=time.time(),
-                    user_id=update.user_id,
-                    engine_id=update.engine_id
-                )
-                
-                return order
-
-     
-
-    
-    async def publish_update(self, symbol: str, bids: List[tuple], asks: List[tuple]):
+                    logger.warning("Sync stream to %s failed, reopening on next update: %s", address, e)
+                    if call is not None:
+                        call.cancel()
+                    call = None
+        finally:
+            if call is not None:
+                call.cancel()
+
+    def apply_peer_updates(self, updates):
+        """Fold order book updates pushed by a peer into the local mirror of that peer's book"""
+        now = time.monotonic()
+        for update in updates:
+            key = (update.address, update.symbol)
+            book = self.peer_books.setdefault(key, {'bids': {}, 'asks': {}})
+            self.peer_book_synced[key] = now
+            best_bid, best_ask = self.peer_bests.get(key, (None, None))
+            self.peer_bests[key] = (self._apply_levels(book['bids'], update.bids, update.delta, best_bid, max),
+                                    self._apply_levels(book['asks'], update.asks, update.delta, best_ask, min))
+
+    def record_peer_best(self, address: str, symbol: str, best_bid: Optional[int], best_ask: Optional[int]):
+        """Record a peer's announced best prices for a symbol, keeping the cached value for any side it left unset"""
+        key = (address, symbol)
+        cached_bid, cached_ask = self.peer_bests.get(key, (None, None))
+        self.peer_bests[key] = (cached_bid if best_bid is None else best_bid,
+                                cached_ask if best_ask is None else best_ask)
+
+    @staticmethod
+    def _apply_levels(mirror: Dict[int, Tuple[float, int]], levels, delta: bool,
+                      best: Optional[int], pick) -> Optional[int]:
         """
-        Publish an order book update to peers.
-        Only prices with >0 volume are considered for best bid and ask.
+        Apply pushed levels to one side of a mirror and return that side's new best price, where pick
+        is max for bids and min for asks. The side is only rescanned when its best level went away.
         """
-        # Filter bids and asks to include only those with volume > 0
-        valid_bids = [(price, quantity, count) for price, quantity, count in bids if quantity > 0]
-        valid_asks = [(price, quantity, count) for price, quantity, count in asks if quantity > 0]
-
-        # Calculate best bid and ask from valid prices
-        best_bid = max((price for price, _, _ in valid_bids), default=None)
-        best_ask = min((price for price, _, _ in valid_asks), default=None)
-
-        # Log filtered bids, asks, and calculated best prices
-        # print(f"current global Best Bid: {best_bid}, Best Ask: {best_ask}")
-
-        # Proceed with publishing the update if there are valid prices
-        update = {
-            'symbol': symbol,
-            'bids': valid_bids,
-            'asks': valid_asks,
-            'timestamp': time.time()
-        }
-        await self.update_queue.put(update)
-        # print(f"Publishing update for {symbol} with {len(valid_bids)} valid bids and {len(valid_asks)} valid asks")
-
-        # Update sequence number
-        self.sequence_number += 1
+        if not delta:
+            mirror.clear()
+            best = None
+        elif best is not None and best not in mirror:
+            # The cached best came from a best-price message rather than this mirror
+            best = pick(mirror, default=None)
+        rescan = False
+        for level in levels:
+            price = to_ticks(level.price)
+            if level.quantity > 0:
+                mirror[price] = (level.quantity, level.order_count)
+                if best is None or pick(price, best) == price:
+                    best = price
+            else:
+                mirror.pop(price, None)
+                rescan = rescan or price == best
+        return pick(mirror, default=None) if rescan else best
+
+    async def publish_update(self, symbol: str, bids: List[tuple], asks: List[tuple],
+                             best_bid: Optional[int] = None, best_ask: Optional[int] = None,
+                             delta: bool = False):
+        """
+        Publish an order book update to peers. Levels are (price_ticks, quantity, order_count).
+        A full snapshot only carries prices with >0 volume and derives best bid and ask from them.
+        A delta carries just the changed levels (zero quantity meaning removed), so the caller
+        passes the book's best prices in.
+        """
+        # Reduce the update to what changed since the last publish, and keep our copy of peer state current
+        sent = self._last_sent.setdefault(symbol, {'bids': {}, 'asks': {}})
+        if delta:
+            changed_bids, changed_asks = bids, asks
+        else:
+            # One pass per side drops empty levels and tracks the best price at the same time
+            current_bids: Dict[int, Tuple[float, int]] = {}
+            best_bid = None
+            for price, quantity, count in bids:
+                if quantity > 0:
+                    current_bids[price] = (quantity, count)
+                    if best_bid is None or price > best_bid:
+                        best_bid = price
+            current_asks: Dict[int, Tuple[float, int]] = {}
+            best_ask = None
+            for price, quantity, count in asks:
+                if quantity > 0:
+                    current_asks[price] = (quantity, count)
+                    if best_ask is None or price < best_ask:
+                        best_ask = price
+            changed_bids = self._diff_levels(sent['bids'], current_bids)
+            changed_asks = self._diff_levels(sent['asks'], current_asks)
+        for levels, changes in ((sent['bids'], changed_bids), (sent['asks'], changed_asks)):
+            for price, quantity, count in changes:
+                if quantity > 0:
+                    levels[price] = (quantity, count)
+                else:
+                    levels.pop(price, None)
+
+        publishes = self._publishes_since_snapshot.get(symbol, 0) + 1
+        if publishes >= FULL_SNAPSHOT_EVERY:
+            # Periodic full book so a peer that missed a write converges again
+            publishes = 0
+            update_bids = [(price, quantity, count) for price, (quantity, count) in sent['bids'].items()]
+            update_asks = [(price, quantity, count) for price, (quantity, count) in sent['asks'].items()]
+            update_delta = False
+        else:
+            update_bids, update_asks, update_delta = changed_bids, changed_asks, True
+        self._publishes_since_snapshot[symbol] = publishes
+
+        if update_bids or update_asks or not update_delta:
+            update = {
+                'symbol': symbol,
+                'bids': update_bids,
+                'asks': update_asks,
+                'delta': update_delta,
+                'sequence_number': self.sequence_number,
+                'timestamp': time.time()
+            }
+            self._pending.append(update)
+            self._wakeup.set()
+            # print(f"Publishing update for {symbol} with {len(update_bids)} bids and {len(update_asks)} asks")
+
+            # Update sequence number
+            self.sequence_number += 1
 
         # Update global best prices
         await self.update_global_best_prices(symbol, best_bid, best_ask)
 
+    @staticmethod
+    def _diff_levels(sent: Dict[int, Tuple[float, int]], current: Dict[int, Tuple[float, int]]) -> List[tuple]:
+        """Levels whose (quantity, count) differ from what was sent, plus zero-quantity removals"""
+        changes = [(price, quantity, count) for price, (quantity, count) in current.items()
+                   if sent.get(price) != (quantity, count)]
+        changes.extend((price, 0, 0) for price in sent if price not in current)
+        return changes
+
     async def broadcast_best_prices(self, symbol: str, best_bid: float, best_ask: float):
         """Broadcast global best bid and ask prices to peers"""
         pb_update = pb2.GlobalBestPriceUpdate(
             symbol=symbol,
             best_bid=best_bid,
             best_ask=best_ask,
-            engine_id=self.engine_id
+            engine_id=self.engine_id,
+            address=self.address
         )
-        tasks = []
-        for address, stub in self.peer_stubs.items():
-            try:
-                tasks.append(stub.SyncGlobalBestPrice(pb_update))
-            except Exception as e:
-                print(f"Error broadcasting best prices to {address}: {e}")
-        
+        tasks = [asyncio.ensure_future(self._next_stub(address).SyncGlobalBestPrice(pb_update))
+                 for address in self.peer_stubs]
+
         if tasks:
             results = await asyncio.gather(*tasks, return_exceptions=True)
-            for result in results:
+            for address, result in zip(self.peer_stubs, results):
                 if isinstance(result, Exception):
-                    print(f"Broadcast error: {result}")
-
-    def extract_engine_id(address: str) -> int:
+                    logger.warning("Error broadcasting best prices to %s: %s", address, result)
+
+    def _get_req(self, symbol: str) -> pb2.GetOrderBookRequest:
+        """Shared GetOrderBookRequest for a symbol"""
+        request = self._req_cache.get(symbol)
+        if request is None:
+            request = self._req_cache[symbol] = pb2.GetOrderBookRequest(symbol=symbol)
+        return request
+
+    async def _refresh_peer_book(self, address: str, symbol: str):
+        """Replace the mirror of one peer's book for a symbol with a fresh GetOrderBook snapshot"""
+        stub = self._next_stub(address)
+        try:
+            response = await stub.GetOrderBook(self._get_req(symbol))
+            key = (address, symbol)
+            self.peer_books[key] = {
+                'bids': {to_ticks(level.price): (level.quantity, level.order_count) for level in response.bids if level.quantity > 0},
+                'asks': {to_ticks(level.price): (level.quantity, level.order_count) for level in response.asks if level.quantity > 0},
+            }
+            self.peer_bests[key] = (max(self.peer_books[key]['bids'], default=None),
+                                    min(self.peer_books[key]['asks'], default=None))
+            self.peer_book_synced[key] = time.monotonic()
+        except Exception as e:
+            logger.warning("Failed to fetch order book from %s for %s: %s", address, symbol, e)
+
+    async def catch_up(self, symbols: Sequence[str]):
         """
-        Extract the engine ID from the given address.
-
-        The engine ID is determined as the last digit of the port minus 1.
-
-        Args:
-            address (str): The peer address in the format 'IP:PORT'.
-
-        Returns:
-            int: The calculated engine ID.
+        One-shot snapshot of every peer's book for the given symbols, so mirrors start out
+        populated and the first orders don't pay for the fetch. Pushes keep them current after.
         """
-        try:
-            # Split the address to extract the port
-            port = address.split(":")[-1]
-
-            # Get the last digit of the port
-            last_digit = int(port[-1])
-
-            # Compute the engine ID
-            engine_id = last_digit - 1
-            return engine_id
-        except (ValueError, IndexError) as e:
-            print(f"Error extracting engine ID from address {address}: {e}")
-            return None
+        await asyncio.gather(*(self._refresh_peer_book(address, symbol)
+                               for address in self.peer_stubs for symbol in symbols))
 
-
-    
-    async def update_global_best_prices(self, symbol: str, highest_bid: float, lowest_ask: float):
+    async def update_global_best_prices(self, symbol: str, highest_bid: Optional[int], lowest_ask: Optional[int]):
         """
         Update the global best prices for a symbol and include engine IDs.
+        Peer bests come from the pushed mirrors, so this is an O(peers) fold; only peers whose mirror
+        is missing or older than PEER_BOOK_TTL_S are fetched over the network.
 
         Args:
             symbol (str): The trading symbol.
-            highest_bid (float): The current highest bid price.
-            lowest_ask (float): The current lowest ask price.
+            highest_bid (int): The current highest bid price in ticks.
+            lowest_ask (int): The current lowest ask price in ticks.
         """
         highest_bid_engine = None
         lowest_ask_engine = None
 
-        for address, stub in self.peer_stubs.items():
-            try:
-                request = pb2.GetOrderBookRequest(symbol=symbol)
-                response = await stub.GetOrderBook(request)
-
-                valid_bids = [price_level for price_level in response.bids if price_level.quantity > 0]
-                valid_asks = [price_level for price_level in response.asks if price_level.quantity > 0]
-
-                peer_highest_bid = max((price_level.price for price_level in valid_bids), default=None)
-                peer_lowest_ask = min((price_level.price for price_level in valid_asks), default=None)
+        now = time.monotonic()
+        stale = [address for address in self.peer_stubs
+                 if now - self.peer_book_synced.get((address, symbol), float('-inf')) > PEER_BOOK_TTL_S]
+        if stale:
+            # Overlap the round-trips so a refresh costs the slowest peer, not the sum of them
+            await asyncio.gather(*(self._refresh_peer_book(address, symbol) for address in stale))
 
-                # Get engine ID from address
-                # engine_id = extract_engine_id(address)
+        for address in self.peer_stubs:
+            bests = self.peer_bests.get((address, symbol))
+            if bests is None:
+                continue
+            peer_highest_bid, peer_lowest_ask = bests
 
-                if peer_highest_bid is not None and (highest_bid is None or peer_highest_bid > highest_bid):
-                    highest_bid = peer_highest_bid
-                    highest_bid_engine = address
+            if peer_highest_bid is not None and (highest_bid is None or peer_highest_bid > highest_bid):
+                highest_bid = peer_highest_bid
+                highest_bid_engine = address
 
-                if peer_lowest_ask is not None and (lowest_ask is None or peer_lowest_ask < lowest_ask):
-                    lowest_ask = peer_lowest_ask
-                    lowest_ask_engine = address
-
-            except Exception as e:
-                print(f"Failed to fetch order book from {address} for {symbol}: {e}")
+            if peer_lowest_ask is not None and (lowest_ask is None or peer_lowest_ask < lowest_ask):
+                lowest_ask = peer_lowest_ask
+                lowest_ask_engine = address
 
         # Save the updated global best prices
-        self.global_best_prices[symbol] = {
-            'best_bid': {'price': highest_bid, 'engine_id': highest_bid_engine},
-            'best_ask': {'price': lowest_ask, 'engine_id': lowest_ask_engine},
-        }
-
-
-
-
+        self.global_best_prices[symbol] = Bbo(highest_bid, highest_bid_engine, lowest_ask, lowest_ask_engine)
 
     def print_global_best_prices(self):
         """Print the global best bid and ask for all symbols."""
         print("\nGlobal Best Prices:")
-        for symbol, prices in self.global_best_prices.items():
-            best_bid = prices['best_bid']
-            best_ask = prices['best_ask']
+        for symbol, bbo in self.global_best_prices.items():
             print(f"Symbol: {symbol}")
-            print(f"  Best Bid: {best_bid if best_bid is not None else 'None'}")
-            print(f"  Best Ask: {best_ask if best_ask is not None else 'None'}")
+            best_bid = bbo.bid_px / TICK if bbo.bid_px is not None else None
+            best_ask = bbo.ask_px / TICK if bbo.ask_px is not None else None
+            print(f"  Best Bid: {best_bid} (engine {bbo.bid_eid})")
+            print(f"  Best Ask: {best_ask} (engine {bbo.ask_eid})")
 
-    async def get_peer_orderbooks(self, symbol: str):
+    async def get_peer_orderbooks(self, symbol: str) -> Dict[str, PeerBookView]:
         """
-        Fetch and maintain order books from all peer engines.
-        This method retrieves the current order books from all peers and updates
-        the local state to reflect the latest data from each engine.
+        Fetch the current aggregate order book for a symbol from every peer engine.
+        Levels stay as (price_ticks, quantity, order_count) tuples; no Order objects are built.
         """
         peer_orderbooks = {}
-
-        for address, stub in self.peer_stubs.items():
-            try:
-                # Create a request for the order book
-                request = pb2.GetOrderBookRequest(symbol=symbol)
-                response = await stub.GetOrderBook(request)
-
-                # Parse response into a structured format
-                peer_orderbooks[address] = {
-                    'bids': [
-                        {'price': level.price, 'quantity': level.quantity, 'order_count': level.order_count}
-                        for level in response.bids if level.quantity > 0
-                    ],
-                    'asks': [
-                        {'price': level.price, 'quantity': level.quantity, 'order_count': level.order_count}
-                        for level in response.asks if level.quantity > 0
-                    ],
-                    'sequence_number': response.sequence_number
-                }
-            except Exception as e:
-                print(f"Failed to fetch order book from {address}: {e}")
+        request = self._get_req(symbol)
+        addresses = list(self.peer_stubs)
+
+        # Fan the fetches out so the total wait is the slowest peer, not the sum of them
+        results = await asyncio.gather(*(self._next_stub(address).GetOrderBook(request) for address in addresses),
+                                       return_exceptions=True)
+        for address, result in zip(addresses, results):
+            if isinstance(result, Exception):
+                logger.warning("Failed to fetch order book from %s: %s", address, result)
+            else:
+                peer_orderbooks[address] = PeerBookView.from_proto(result)
 
         return peer_orderbooks
-    
+
     async def fetch_peer_order_book(self, symbol: str, engine_address: str) -> Optional[OrderBook]:
         """
         Fetch the order book for a symbol from a peer engine.
@@ -327,54 +492,42 @@ class OrderBookSynchronizer:
         Returns:
             Optional[OrderBook]: The retrieved order book in internal format, or None if unavailable.
         """
-        stub = self.peer_stubs.get(engine_address)
-        if not stub:
-            print(f"Error: No gRPC stub found for engine address {engine_address}")
+        if engine_address not in self.stub_pools:
+            logger.error("No gRPC stub found for engine address %s", engine_address)
             return None
+        stub = self._next_stub(engine_address)
 
         try:
             # Request order book from the peer
-            request = pb2.GetOrderBookRequest(symbol=symbol)
-            response = await stub.GetOrderBook(request)
+            response = await stub.GetOrderBook(self._get_req(symbol))
 
-            # Convert the protobuf response into an internal OrderBook object
+            # Convert the protobuf response into an internal OrderBook object. Peers only report aggregates,
+            # so each level holds one synthetic order carrying the level's total quantity
             orderbook = OrderBook(symbol=symbol)
-            for bid in response.bids:
-                orderbook.bids[bid.price] = [
-                    Order(
-                        order_id=str(uuid.uuid4()),
-                        symbol=symbol,
-                        side=Side.BUY,
-                        price=bid.price,
-                        quantity=bid.quantity,
-                        remaining_quantity=bid.quantity,
-                        status=OrderStatus.NEW,
-                        timestamp=datetime.now().timestamp(),
-                        user_id="peer",
-                        engine_id=engine_address,
-                    )
-                    for _ in range(bid.order_count)
-                ]
-            for ask in response.asks:
-                orderbook.asks[ask.price] = [
-                    Order(
-                        order_id=str(uuid.uuid4()),
+            now = time.time_ns()
+            for levels, book, level_qty, side in ((response.bids, orderbook.bids, orderbook.bid_qty, Side.BUY),
+                                                  (response.asks, orderbook.asks, orderbook.ask_qty, Side.SELL)):
+                for level in levels:
+                    if level.quantity <= 0:
+                        continue
+                    price = to_ticks(level.price)
+                    book[price] = deque((Order(
+                        order_id=f"peer:{engine_address}:{price}",
                         symbol=symbol,
-                        side=Side.SELL,
-                        price=ask.price,
-                        quantity=ask.quantity,
-                        remaining_quantity=ask.quantity,
+                        side=side,
+                        price=level.price,
+                        quantity=level.quantity,
+                        remaining_quantity=level.quantity,
                         status=OrderStatus.NEW,
-                        timestamp=datetime.now().timestamp(),
+                        timestamp=now,
                         user_id="peer",
                         engine_id=engine_address,
-                    )
-                    for _ in range(ask.order_count)
-                ]
+                    ),))
+                    level_qty[price] = level.quantity
             return orderbook
 
         except grpc.RpcError as e:
-            print(f"Failed to fetch order book from engine at {engine_address}: {e.details()}")
+            logger.warning("Failed to fetch order book from engine at %s: %s", engine_address, e.details())
             return None
 
         
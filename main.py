@@ -3,142 +3,169 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 import asyncio
+import itertools
+import logging
+import logging.handlers
+import queue
 import random
 import time
-from typing import List
-import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
 import grpc
 import grpc.aio
+from google.protobuf.internal import api_implementation
+
+try:
+    import uvloop
+except ImportError:  # uvloop is not available on Windows
+    uvloop = None
 
 from engine.match_engine import MatchEngine
 from engine.synchronizer import OrderBookSynchronizer
-from common.order import Order, Side, OrderStatus
+from common.order import TICK, Order, Side, OrderStatus
+from common.latency import LatencyHistogram
 from network.grpc_server import serve
 
+SIDES = (Side.BUY, Side.SELL)
+
+logger = logging.getLogger(__name__)
+
 class MatchingSystemSimulator:
-    def __init__(self, num_engines: int = 3, base_port: int = 50051):
+    def __init__(self, num_engines: int = 3, base_port: int = 50051, seed: Optional[int] = None):
         self.num_engines = num_engines
         self.base_port = base_port
         self.engines = []
         self.synchronizers = []
         self.servers = []
         self.address_to_engine_id = {}
+        # Per-engine latency histograms, merged when reporting
+        self.latency_hists: Dict[int, LatencyHistogram] = defaultdict(LatencyHistogram)
+        # Order ids only need to be unique within the simulation, not random
+        self._order_seq = itertools.count(1)
+        # Private generator so a seed reproduces the workload and calls skip the module-level wrapper
+        self._rng = random.Random(seed)
         
     async def setup(self):
         """Set up matching engines and synchronizers"""
-        # Create engines and synchronizers
-        for i in range(self.num_engines):
-            
-            
-            # Create peer address list for each engine
-            peer_addresses = [
-                f"127.0.0.1:{self.base_port + j}"
-                for j in range(self.num_engines)
-                if j != i
-            ]
-            
-            # Create and start synchronizer
-            synchronizer = OrderBookSynchronizer(
-                engine_id=f"engine_{i}",
-                peer_addresses=peer_addresses
-            )
-            engine = MatchEngine(engine_id=i, synchronizer=synchronizer)
+        # Bring every engine up concurrently; gather keeps the results in engine order
+        started = await asyncio.gather(*(self._bring_up(i) for i in range(self.num_engines)),
+                                       return_exceptions=True)
+        failures = [result for result in started if isinstance(result, BaseException)]
+        for i, result in enumerate(started):
+            if isinstance(result, BaseException):
+                continue
+            engine, synchronizer, server = result
             self.engines.append(engine)
-            await synchronizer.start()  # Start the synchronizer
             self.synchronizers.append(synchronizer)
-            
-            # Start gRPC server
-            try:
-                server = await serve(
-                    engine,
-                    synchronizer,  # Pass the synchronizer here
-                    f"127.0.0.1:{self.base_port + i}"
-                )
-                self.servers.append(server)
-                address = f"127.0.0.1:{self.base_port + i}"
-                self.address_to_engine_id[address] = i
-
-                print(f"Started server {i} on port {self.base_port + i}")
-            except Exception as e:
-                print(f"Failed to start server {i}: {e}")
-                raise
-        
-        # Wait for servers to start
-        await asyncio.sleep(2)
+            self.servers.append(server)
+            self.address_to_engine_id[f"127.0.0.1:{self.base_port + i}"] = i
+        if failures:
+            # Don't leave the engines that did come up running behind a failed setup
+            await self.cleanup()
+            self.engines.clear()
+            self.synchronizers.clear()
+            self.servers.clear()
+            self.address_to_engine_id.clear()
+            raise failures[0]
+
+        # Wait until every peer channel is connected rather than sleeping a fixed time
+        setup_start = time.perf_counter()
+        await asyncio.wait_for(asyncio.gather(*(self._wait_ready(synchronizer, setup_start)
+                                                for synchronizer in self.synchronizers)), timeout=10.0)
+
+    async def _bring_up(self, i: int) -> Tuple[MatchEngine, OrderBookSynchronizer, grpc.aio.Server]:
+        """Create engine i with its synchronizer and start its gRPC server"""
+        address = f"127.0.0.1:{self.base_port + i}"
+        # Create peer address list for each engine
+        peer_addresses = [
+            f"127.0.0.1:{self.base_port + j}"
+            for j in range(self.num_engines)
+            if j != i
+        ]
+
+        # Create and start synchronizer
+        synchronizer = OrderBookSynchronizer(
+            engine_id=f"engine_{i}",
+            peer_addresses=peer_addresses,
+            address=address
+        )
+        engine = MatchEngine(engine_id=i, synchronizer=synchronizer)
+        await synchronizer.start()  # Start the synchronizer
+
+        # Start gRPC server
+        try:
+            server = await serve(
+                engine,
+                synchronizer,  # Pass the synchronizer here
+                address
+            )
+            logger.info("Started server %d on port %d", i, self.base_port + i)
+        except Exception as e:
+            logger.error("Failed to start server %d: %s", i, e)
+            await synchronizer.stop()
+            raise
+        return engine, synchronizer, server
+
+    @staticmethod
+    async def _wait_ready(synchronizer: OrderBookSynchronizer, since: float):
+        """Block until all of a synchronizer's peer channels are READY"""
+        await asyncio.gather(*(channel.channel_ready() for _, channel in synchronizer.peer_channels))
+        logger.info("%s connected to peers in %.1fms", synchronizer.engine_id, (time.perf_counter() - since) * 1000)
 
-        
     async def cleanup(self):
         """Cleanup resources"""
-        # Stop synchronizers
-        for synchronizer in self.synchronizers:
-            await synchronizer.stop()
+        # Stop synchronizers, then servers; each group shuts down concurrently and is awaited to completion
+        await asyncio.gather(*(synchronizer.stop() for synchronizer in self.synchronizers))
+        await asyncio.gather(*(server.stop(grace=None) for server in self.servers))
         
-        # Stop servers
-        for server in self.servers:
-            await server.stop(grace=None)
-        
-    async def run_simulation(self, num_orders: int = 1000, symbols: List[str] = None):
+    async def run_simulation(self, num_orders: int = 1000, symbols: Optional[Sequence[str]] = None,
+                             inter_arrival_s: float = 0.0, max_inflight: int = 32):
         """
         Run trading simulation by generating and submitting random orders.
         Orders are randomly assigned to engines, and their execution is logged.
+        Up to max_inflight orders are in flight at once; inter_arrival_s optionally paces generation.
         """
         if symbols is None:
-            # symbols = ["BTC-USD", "DOGE-BTC", "DUCK-DOGE"]
-            symbols = ["BTC-USD"]
+            # symbols = ("BTC-USD", "DOGE-BTC", "DUCK-DOGE")
+            symbols = ("BTC-USD",)
+        # Freeze once so the caller's list can't change mid-run and choice() indexes a tuple
+        symbols = tuple(symbols)
+
+        # Seed every synchronizer's peer mirrors before the first order needs them
+        await asyncio.gather(*(synchronizer.catch_up(symbols) for synchronizer in self.synchronizers))
 
         print("Starting simulation...")
-        start_time = time.time()
+        start_time = time.perf_counter()  # Monotonic, so a clock step cannot skew the run time
 
         try:
-            for i in range(num_orders):
-                try:
-                    # Generate a random order
-                    # print(f"Simulation iteration {i+1}: Generating random order.")
-                    order = self._generate_random_order(symbols)
-                    # print(f"Generated order: {order}")
-
-                    # Select a random engine
-                    engine_idx = random.randrange(len(self.engines))
-                    engine = self.engines[engine_idx]
-                    synchronizer = self.synchronizers[engine_idx]
-                    # print(f"Selected engine {engine_idx} (Engine ID: {engine.engine_id}).")
-
-                    # Submit the order and measure latency
-                    submit_time = time.time()
-                    # Use a timeout to detect hanging calls
-
-
-                    islocal, idx, fills = await asyncio.wait_for(engine.submit_order(order), timeout=15.0)
-                    if not islocal:
-                        engine_idx = self.address_to_engine_id[idx]
-                        engine = self.engines[engine_idx]
-                        islocal, idx, fills = await asyncio.wait_for(engine.submit_order(order), timeout=15.0)
-
-                    # Publish the update to peers if there are fills
-                    if fills:
-                        orderbook = engine.orderbooks.get(order.symbol)
-                        if orderbook:
-                            bids = [(price, sum(o.remaining_quantity for o in orders), len(orders)) 
-                                    for price, orders in orderbook.bids.items()]
-                            asks = [(price, sum(o.remaining_quantity for o in orders), len(orders)) 
-                                    for price, orders in orderbook.asks.items()]
-                            await synchronizer.publish_update(order.symbol, bids, asks)
-
-                    latency = time.time() - submit_time
-                    print(f"Order {i+1}: {order.order_id} executed in {latency*1000:.2f}ms with {len(fills)} fills.")
-
-                    await asyncio.sleep(0.1)
-
-                except asyncio.TimeoutError:
-                    print(f"Iteration {i+1}: submit_order timed out for order {order.order_id}. Skipping to next.")
-                except Exception as e:
-                    print(f"Iteration {i+1}: Error during order submission: {e}. Skipping to next.")
+            inflight = asyncio.Semaphore(max_inflight)
+            tasks = []
+            # Draw every order's engine up front; one choices() call is far cheaper than a randrange() per order
+            engine_indices = self._rng.choices(range(len(self.engines)), k=num_orders)
+            for i, engine_idx in enumerate(engine_indices):
+                # Generate a random order
+                order = self._generate_random_order(symbols)
+
+                # Generation only waits when max_inflight submissions are outstanding
+                await inflight.acquire()
+                tasks.append(asyncio.create_task(self._submit_and_publish(i, order, engine_idx, inflight)))
+                if inter_arrival_s:
+                    await asyncio.sleep(inter_arrival_s)
+            await asyncio.gather(*tasks)
 
             # Simulation completion
-            total_time = time.time() - start_time
+            total_time = time.perf_counter() - start_time
             print(f"\nSimulation completed:")
             print(f"Processed {num_orders} orders in {total_time:.2f} seconds")
-            print(f"Average latency: {(total_time / num_orders) * 1000:.2f}ms per order")
+            print(f"Average wall time: {(total_time / num_orders) * 1000:.2f}ms per order")
+            latency_hist = LatencyHistogram()
+            for hist in self.latency_hists.values():
+                latency_hist.merge(hist)
+            if latency_hist.count:
+                print(f"Average latency: {latency_hist.mean() / 1000:.2f}ms per order")
+                print(f"Latency p50/p95/p99: {latency_hist.percentile(50) / 1000:.2f}/"
+                      f"{latency_hist.percentile(95) / 1000:.2f}/"
+                      f"{latency_hist.percentile(99) / 1000:.2f}ms")
 
             # Print final order book state
             await self._print_order_books(symbols)
@@ -148,6 +175,45 @@ class MatchingSystemSimulator:
             raise
 
             
+    async def _submit_and_publish(self, i: int, order: Order, engine_idx: int, inflight: asyncio.Semaphore):
+        """Submit one order (following a reroute if needed), publish leftover dirty levels and record latency"""
+        try:
+            engine = self.engines[engine_idx]
+            synchronizer = self.synchronizers[engine_idx]
+
+            # Submit the order and measure latency
+            submit_ns = time.perf_counter_ns()
+            # Use a timeout to detect hanging calls
+            islocal, idx, fills = await asyncio.wait_for(engine.submit_order(order), timeout=15.0)
+            if not islocal:
+                engine_idx = self.address_to_engine_id[idx]
+                engine = self.engines[engine_idx]
+                synchronizer = self.synchronizers[engine_idx]
+                islocal, idx, fills = await asyncio.wait_for(engine.submit_order(order), timeout=15.0)
+
+            # Publish the update to peers if there are fills; submit_order already sent the
+            # levels it touched, so only levels still marked dirty need to go out
+            if fills:
+                orderbook = engine.orderbooks.get(order.symbol)
+                if orderbook:
+                    bids, asks = orderbook.pop_dirty_levels()
+                    if bids or asks:
+                        await synchronizer.publish_update(order.symbol, bids, asks,
+                                                          best_bid=orderbook.best_bid,
+                                                          best_ask=orderbook.best_ask,
+                                                          delta=True)
+
+            latency_ns = time.perf_counter_ns() - submit_ns
+            self.latency_hists[engine_idx].record(latency_ns // 1000)
+            logger.debug("Order %d: %s executed in %.2fms with %d fills.", i + 1, order.order_id, latency_ns / 1e6, len(fills))
+
+        except asyncio.TimeoutError:
+            logger.warning("Iteration %d: submit_order timed out for order %s. Skipping to next.", i + 1, order.order_id)
+        except Exception as e:
+            logger.warning("Iteration %d: Error during order submission: %s. Skipping to next.", i + 1, e)
+        finally:
+            inflight.release()
+
     async def _print_order_books(self, symbols: List[str]):
         """Print final state of all order books"""
         for symbol in symbols:
@@ -156,30 +222,47 @@ class MatchingSystemSimulator:
                 if symbol in engine.orderbooks:
                     book = engine.orderbooks[symbol]
                     print(f"\nEngine {engine.engine_id}:")
+                    # Levels are already sorted and totalled by the book, so the top five are read straight off
                     print("Bids:")
-                    for price in sorted(book.bids.keys(), reverse=True)[:5]:
-                        print(f"  {price}: {sum(o.remaining_quantity for o in book.bids[price])}")
+                    for price in itertools.islice(reversed(book.bids), 5):
+                        print(f"  {price / TICK}: {book.bid_qty[price]}")
                     print("Asks:")
-                    for price in sorted(book.asks.keys())[:5]:
-                        print(f"  {price}: {sum(o.remaining_quantity for o in book.asks[price])}")
+                    for price in itertools.islice(book.asks, 5):
+                        print(f"  {price / TICK}: {book.ask_qty[price]}")
 
 
-    def _generate_random_order(self, symbols: List[str]) -> Order:
+    def _generate_random_order(self, symbols: Tuple[str, ...]) -> Order:
         """Generate a random order"""
+        rng = self._rng
+        quantity = rng.randrange(1, 101)
         return Order(
-            order_id=str(uuid.uuid4()),
-            symbol=random.choice(symbols),
-            side=random.choice([Side.BUY, Side.SELL]),
-            price=round(random.uniform(90, 110), 2),
-            quantity=random.randint(1, 100),
-            remaining_quantity=random.randint(1, 100),
+            order_id=f"order_{next(self._order_seq)}",
+            symbol=symbols[rng.randrange(len(symbols))],
+            side=SIDES[rng.getrandbits(1)],
+            price=round(90 + rng.random() * 20, 2),
+            quantity=quantity,
+            remaining_quantity=quantity,
             status=OrderStatus.NEW,
-            timestamp=time.time(),
-            user_id=f"user_{random.randint(1, 10)}",
+            timestamp=time.time_ns(),
+            user_id=f"user_{rng.randrange(1, 11)}",
             engine_id=""
         )
 
 async def main():
+    # Records are only enqueued on the event loop; formatting and the stderr write happen on the listener thread
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter("%(message)s"))  # Only merges args; the listener does the layout
+    logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
+    listener.start()
+
+    # Every broadcast and peer fetch goes through protobuf; the pure-Python backend is many times slower
+    if api_implementation.Type() != 'upb':
+        logger.warning("protobuf is using the %s backend, not upb; sync will be slow", api_implementation.Type())
+
     # Initialize gRPC (non-async call)
     grpc.aio.init_grpc_aio()
     
@@ -202,6 +285,11 @@ async def main():
     finally:
         # Cleanup
         await simulator.cleanup()
+        listener.stop()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # Prefer the libuv-based event loop for lower scheduling overhead
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
\ No newline at end of file
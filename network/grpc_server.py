@@ -1,23 +1,96 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import grpc
 from grpc import aio
 
 from proto import matching_service_pb2 as pb2
 from proto import matching_service_pb2_grpc as pb2_grpc
+from common.order import TICK, Order, OrderStatus, Side, to_ticks
 from engine.match_engine import MatchEngine
 from engine.synchronizer import OrderBookSynchronizer
 
+logger = logging.getLogger(__name__)
+
+# Accept the peers' 10 s keepalive pings (see engine.synchronizer.CHANNEL_OPTIONS) instead of
+# answering them with GOAWAY too_many_pings, and allow the matching message size. The receive window
+# mirrors the peers' lookahead so incoming sync streams aren't gated by flow control, and larger
+# frames let a full-book snapshot go out in one piece
+SERVER_OPTIONS = [
+    ('grpc.keepalive_permit_without_calls', 1),
+    ('grpc.http2.min_ping_interval_without_data_ms', 5000),
+    ('grpc.http2.max_ping_strikes', 0),
+    ('grpc.max_receive_message_length', 16 << 20),
+    ('grpc.max_concurrent_streams', 1000),
+    ('grpc.http2.lookahead_bytes', 1 << 20),
+    ('grpc.http2.max_frame_size', 1 << 20),
+]
+
+EMPTY_BOOKS_MAX = 256  # Cached empty GetOrderBook responses for symbols this engine has no book for
+
+# Marks a SubmitOrder call that a peer forwarded after rerouting, so it is not forwarded again
+FORWARDED_METADATA = (('x-rerouted-from', 'peer'),)
+
 class MatchingServicer(pb2_grpc.MatchingServiceServicer):
     def __init__(self, engine, synchronizer):
         self.engine = engine
         self.synchronizer = synchronizer
+        # (RPC name, symbol) -> (book version, response); peers asking for an unchanged book share one message
+        self._book_cache: Dict[Tuple[str, str], Tuple[int, object]] = {}
+        # symbol -> empty OrderBook for symbols with no local book; bounded LRU since peers pick the names
+        self._empty_books: Dict[str, object] = OrderedDict()
+        # (sender, symbol) -> newest peer (best_bid, best_ask) ticks from SyncGlobalBestPrice, folded in by _drain_best_prices
+        self._pending_best: Dict[Tuple[str, str], Tuple[Optional[int], Optional[int]]] = {}
+        self._best_wakeup = asyncio.Event()
+
+    @staticmethod
+    def _is_forwarded(context) -> bool:
+        """True if the call came from a peer forwarding a rerouted order"""
+        return any(key == FORWARDED_METADATA[0][0] for key, _ in context.invocation_metadata() or ())
 
     async def SubmitOrder(self, request, context):
         try:
+            # Normalize the wire order once at ingress so the engine only compares enums
+            order = Order(
+                order_id=request.order_id,
+                symbol=request.symbol,
+                side=Side[request.side],
+                price=request.price,
+                quantity=request.quantity,
+                remaining_quantity=request.quantity,
+                status=OrderStatus.NEW,
+                timestamp=request.timestamp,
+                user_id=request.user_id,
+                engine_id=self.engine.engine_id
+            )
             # Await the asynchronous submit_order method
-            await self.engine.submit_order(request)
-            return pb2.SubmitOrderResponse(
+            islocal, target, fills = await self.engine.submit_order(order)
+            if not islocal:
+                # A peer holds the better price, so the order was not booked here. Forward it once; an order
+                # that was already forwarded goes back to the caller rather than bouncing between engines
+                if not self._is_forwarded(context) and self.synchronizer.has_peer(target):
+                    return await self.synchronizer.forward_order(target, request, FORWARDED_METADATA)
+                return pb2.SubmitOrderResponse(
+                    order_id=request.order_id,
+                    status="REROUTED",
+                    error_message=target
+                )
+            response = pb2.SubmitOrderResponse(
                 order_id=request.order_id,
                 status="SUCCESS"
             )
+            for fill in fills:
+                response.fills.add(
+                    fill_id=str(fill.fill_id),
+                    buy_order_id=fill.buy_order_id,
+                    sell_order_id=fill.sell_order_id,
+                    price=fill.price,
+                    quantity=fill.quantity,
+                    timestamp=fill.timestamp
+                )
+            return response
         except Exception as e:
             return pb2.SubmitOrderResponse(
                 order_id=request.order_id,
@@ -25,6 +98,11 @@ class MatchingServicer(pb2_grpc.MatchingServiceServicer):
                 error_message=str(e)
             )
 
+    async def SubmitOrders(self, request_iterator, context):
+        """Stream variant of SubmitOrder that avoids a unary round-trip per order"""
+        async for request in request_iterator:
+            yield await self.SubmitOrder(request, context)
+
     async def CancelOrder(self, request, context):
         try:
             result = self.engine.cancel_order(request.order_id)
@@ -39,6 +117,15 @@ class MatchingServicer(pb2_grpc.MatchingServiceServicer):
                 error_message=str(e)
             )
 
+    @staticmethod
+    def _fill_levels(response, orderbook):
+        """Append the book's aggregate levels to response.bids/asks. Totals are kept by the book, so this is O(levels)"""
+        for levels, book, level_qty in ((response.bids, orderbook.bids, orderbook.bid_qty),
+                                        (response.asks, orderbook.asks, orderbook.ask_qty)):
+            add = levels.add  # add(**fields) sets all three in one call, faster than per-attribute assignment
+            for price, orders in book.items():
+                add(price=price / TICK, quantity=level_qty[price], order_count=len(orders))
+
     async def SyncOrderBook(self, request, context):
         """
         Synchronize order book by providing the current state of the symbol's bids and asks.
@@ -46,8 +133,9 @@ class MatchingServicer(pb2_grpc.MatchingServiceServicer):
         symbol = request.symbol
 
         # Ensure the requested symbol exists in the local engine
-        if symbol not in self.engine.orderbooks:
-            print(f"Symbol {symbol} not found in local order books.")
+        orderbook = self.engine.orderbooks.get(symbol)
+        if orderbook is None:
+            logger.warning("Symbol %s not found in local order books.", symbol)
             return pb2.OrderBookUpdate(
                 symbol=symbol,
                 engine_id=self.engine.engine_id,
@@ -55,81 +143,84 @@ class MatchingServicer(pb2_grpc.MatchingServiceServicer):
                 asks=[]   # Empty asks
             )
 
-        # Retrieve the local order book for the symbol
-        orderbook = self.engine.orderbooks[symbol]
-
-        # Construct the response with bids and asks
-        response = pb2.OrderBookUpdate(
-            symbol=symbol,
-            engine_id=self.engine.engine_id,
-            bids=[
-                pb2.PriceLevel(
-                    price=price,
-                    quantity=sum(o.remaining_quantity for o in orders),
-                    order_count=len(orders)
-                )
-                for price, orders in orderbook.bids.items()
-            ],
-            asks=[
-                pb2.PriceLevel(
-                    price=price,
-                    quantity=sum(o.remaining_quantity for o in orders),
-                    order_count=len(orders)
-                )
-                for price, orders in orderbook.asks.items()
-            ]
-        )
+        # Construct the response with bids and asks, filling the repeated fields in place
+        cached = self._book_cache.get(('SyncOrderBook', symbol))
+        if cached is not None and cached[0] == orderbook.version:
+            return cached[1]
+        response = pb2.OrderBookUpdate(symbol=symbol, engine_id=self.engine.engine_id)
+        self._fill_levels(response, orderbook)
+        self._book_cache[('SyncOrderBook', symbol)] = (orderbook.version, response)
 
-        print(f"SyncOrderBook response for {symbol}: Bids={response.bids}, Asks={response.asks}")
+        logger.debug("SyncOrderBook response for %s: Bids=%s, Asks=%s", symbol, response.bids, response.asks)
         return response
 
 
+    async def SyncOrderBookStream(self, request_iterator, context):
+        """Apply update batches from a peer's persistent stream as they arrive"""
+        async for batch in request_iterator:
+            self.synchronizer.apply_peer_updates(batch.updates)
+        return pb2.Empty()
+
     async def GetOrderBook(self, request, context):
         symbol = request.symbol
-        if symbol in self.engine.orderbooks:
-            orderbook = self.engine.orderbooks[symbol]
-            # print(f"Server processing GetOrderBook for {symbol}")
-            # print(f"Bids: {orderbook.bids}")
-            # print(f"Asks: {orderbook.asks}")
-            response = pb2.OrderBook(
-                symbol=symbol,
-                bids=[
-                    pb2.PriceLevel(price=price, quantity=sum(o.remaining_quantity for o in orders), order_count=len(orders))
-                    for price, orders in orderbook.bids.items()
-                ],
-                asks=[
-                    pb2.PriceLevel(price=price, quantity=sum(o.remaining_quantity for o in orders), order_count=len(orders))
-                    for price, orders in orderbook.asks.items()
-                ]
-            )
-            # print(f"Response to be sent: {response}")
+        orderbook = self.engine.orderbooks.get(symbol)
+        if orderbook is None:
+            # Repeated misses share one empty message; only the most recent EMPTY_BOOKS_MAX symbols are kept
+            response = self._empty_books.get(symbol)
+            if response is None:
+                response = self._empty_books[symbol] = pb2.OrderBook(symbol=symbol)
+                if len(self._empty_books) > EMPTY_BOOKS_MAX:
+                    self._empty_books.popitem(last=False)
+            else:
+                self._empty_books.move_to_end(symbol)
             return response
 
-        # print(f"Symbol {symbol} not found in order books")
-        return pb2.OrderBook(symbol=symbol)
+        cached = self._book_cache.get(('GetOrderBook', symbol))
+        if cached is not None and cached[0] == orderbook.version:
+            return cached[1]
+        response = pb2.OrderBook(symbol=symbol)
+        self._fill_levels(response, orderbook)
+        self._book_cache[('GetOrderBook', symbol)] = (orderbook.version, response)
+        return response
 
     async def SyncGlobalBestPrice(self, request, context):
         """Handle incoming global best price updates from peers"""
-        symbol = request.symbol
-        best_bid = request.best_bid
-        best_ask = request.best_ask
-        
-        # Debugging log for incoming global best price updates
-        # print(f"Received global best price update for {symbol}: "
-              # f"Best Bid={best_bid}, Best Ask={best_ask}")
-
-        # Update the global best prices in the synchronizer
-        await self.synchronizer.update_global_best_prices(symbol, best_bid, best_ask)
+        # These are the sender's bests, not ours; an unset side arrives as 0.0 and carries no price
+        sender = request.address or request.engine_id
+        best_bid = to_ticks(request.best_bid) if request.best_bid > 0 else None
+        best_ask = to_ticks(request.best_ask) if request.best_ask > 0 else None
+        # Only the newest prices per sender and symbol matter, so record them and let the drainer fold them in
+        self._pending_best[(sender, request.symbol)] = (best_bid, best_ask)
+        self._best_wakeup.set()
         return pb2.Empty()
+
+    async def _drain_best_prices(self):
+        """Apply coalesced peer best prices to the synchronizer, then refold each touched symbol once per wakeup"""
+        while True:
+            await self._best_wakeup.wait()
+            self._best_wakeup.clear()
+            pending, self._pending_best = self._pending_best, {}
+            for (sender, symbol), (best_bid, best_ask) in pending.items():
+                self.synchronizer.record_peer_best(sender, symbol, best_bid, best_ask)
+            for symbol in {symbol for _, symbol in pending}:
+                book = self.engine.orderbooks.get(symbol)
+                try:
+                    await self.synchronizer.update_global_best_prices(
+                        symbol, book.best_bid if book else None, book.best_ask if book else None)
+                except Exception as e:
+                    logger.warning("Failed to apply best prices for %s: %s", symbol, e)
     
-async def serve(engine: MatchEngine, synchronizer: OrderBookSynchronizer, address: str) -> aio.Server:
-    """Start gRPC server"""
+async def serve(engine: MatchEngine, synchronizer: OrderBookSynchronizer, address: str,
+                compression: Optional[grpc.Compression] = None) -> aio.Server:
+    """Start gRPC server; compression applies to responses, e.g. full books sent by GetOrderBook"""
     # Create server using aio specifically
-    server = aio.server()
+    server = aio.server(options=SERVER_OPTIONS, compression=compression)
     
     # Add the service with engine and synchronizer
     service = MatchingServicer(engine, synchronizer)
     pb2_grpc.add_MatchingServiceServicer_to_server(service, server)
+    # The best-price drainer lives as long as the synchronizer, whose stop() cancels and awaits it
+    drainer = synchronizer.spawn(service._drain_best_prices())
     
     try:
         # Add the port
@@ -137,11 +228,12 @@ async def serve(engine: MatchEngine, synchronizer: OrderBookSynchronizer, addres
         
         # Start the server
         await server.start()
-        print(f"Server started on {address}")
+        logger.info("Server started on %s", address)
         
         return server
         
     except Exception as e:
-        print(f"Error starting server: {e}")
+        logger.error("Error starting server: %s", e)
+        drainer.cancel()
         await server.stop(0)
         raise
@@ -27,7 +27,7 @@ _sym_db = _symbol_database.Default()
 from google.protobuf import empty_pb2 as google_dot_protobuf_dot_empty__pb2
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x1cproto/matching_service.proto\x12\x08matching\x1a\x1bgoogle/protobuf/empty.proto\"|\n\x05Order\x12\x10\n\x08order_id\x18\x01 \x01(\t\x12\x0e\n\x06symbol\x18\x02 \x01(\t\x12\x0c\n\x04side\x18\x03 \x01(\t\x12\r\n\x05price\x18\x04 \x01(\x01\x12\x10\n\x08quantity\x18\x05 \x01(\x01\x12\x0f\n\x07user_id\x18\x06 \x01(\t\x12\x11\n\ttimestamp\x18\x07 \x01(\x03\"m\n\x13SubmitOrderResponse\x12\x10\n\x08order_id\x18\x01 \x01(\t\x12\x1d\n\x05\x66ills\x18\x02 \x03(\x0b\x32\x0e.matching.Fill\x12\x0e\n\x06status\x18\x03 \x01(\t\x12\x15\n\rerror_message\x18\x04 \x01(\t\"x\n\x04\x46ill\x12\x0f\n\x07\x66ill_id\x18\x01 \x01(\t\x12\x14\n\x0c\x62uy_order_id\x18\x02 \x01(\t\x12\x15\n\rsell_order_id\x18\x03 \x01(\t\x12\r\n\x05price\x18\x04 \x01(\x01\x12\x10\n\x08quantity\x18\x05 \x01(\x01\x12\x11\n\ttimestamp\x18\x06 \x01(\x03\"7\n\x12\x43\x61ncelOrderRequest\x12\x10\n\x08order_id\x18\x01 \x01(\t\x12\x0f\n\x07user_id\x18\x02 \x01(\t\"N\n\x13\x43\x61ncelOrderResponse\x12\x10\n\x08order_id\x18\x01 \x01(\t\x12\x0e\n\x06status\x18\x02 \x01(\t\x12\x15\n\rerror_message\x18\x03 \x01(\t\"0\n\x0bSyncRequest\x12\x0e\n\x06symbol\x18\x01 \x01(\t\x12\x11\n\tengine_id\x18\x02 \x01(\t\"\x95\x01\n\x0fOrderBookUpdate\x12\x0e\n\x06symbol\x18\x01 \x01(\t\x12\"\n\x04\x62ids\x18\x02 \x03(\x0b\x32\x14.matching.PriceLevel\x12\"\n\x04\x61sks\x18\x03 \x03(\x0b\x32\x14.matching.PriceLevel\x12\x17\n\x0fsequence_number\x18\x04 \x01(\x03\x12\x11\n\tengine_id\x18\x05 \x01(\t\"B\n\nPriceLevel\x12\r\n\x05price\x18\x01 \x01(\x01\x12\x10\n\x08quantity\x18\x02 \x01(\x01\x12\x13\n\x0border_count\x18\x03 \x01(\x05\"%\n\x13GetOrderBookRequest\x12\x0e\n\x06symbol\x18\x01 \x01(\t\"v\n\tOrderBook\x12\x0e\n\x06symbol\x18\x01 \x01(\t\x12\"\n\x04\x62ids\x18\x02 \x03(\x0b\x32\x14.matching.PriceLevel\x12\"\n\x04\x61sks\x18\x03 \x03(\x0b\x32\x14.matching.PriceLevel\x12\x11\n\ttimestamp\x18\x04 \x01(\x03\"^\n\x15GlobalBestPriceUpdate\x12\x0e\n\x06symbol\x18\x01 \x01(\t\x12\x10\n\x08\x62\x65st_bid\x18\x02 \x01(\x01\x12\x10\n\x08\x62\x65st_ask\x18\x03 \x01(\x01\x12\x11\n\tengine_id\x18\x04 \x01(\t2\xf5\x02\n\x0fMatchingService\x12=\n\x0bSubmitOrder\x12\x0f.matching.Order\x1a\x1d.matching.SubmitOrderResponse\x12J\n\x0b\x43\x61ncelOrder\x12\x1c.matching.CancelOrderRequest\x1a\x1d.matching.CancelOrderResponse\x12\x43\n\rSyncOrderBook\x12\x15.matching.SyncRequest\x1a\x19.matching.OrderBookUpdate0\x01\x12\x42\n\x0cGetOrderBook\x12\x1d.matching.GetOrderBookRequest\x1a\x13.matching.OrderBook\x12N\n\x13SyncGlobalBestPrice\x12\x1f.matching.GlobalBestPriceUpdate\x1a\x16.google.protobuf.Emptyb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x1cproto/matching_service.proto\x12\x08matching\x1a\x1bgoogle/protobuf/empty.proto\"|\n\x05Order\x12\x10\n\x08order_id\x18\x01 \x01(\t\x12\x0e\n\x06symbol\x18\x02 \x01(\t\x12\x0c\n\x04side\x18\x03 \x01(\t\x12\r\n\x05price\x18\x04 \x01(\x01\x12\x10\n\x08quantity\x18\x05 \x01(\x01\x12\x0f\n\x07user_id\x18\x06 \x01(\t\x12\x11\n\ttimestamp\x18\x07 \x01(\x03\"m\n\x13SubmitOrderResponse\x12\x10\n\x08order_id\x18\x01 \x01(\t\x12\x1d\n\x05\x66ills\x18\x02 \x03(\x0b\x32\x0e.matching.Fill\x12\x0e\n\x06status\x18\x03 \x01(\t\x12\x15\n\rerror_message\x18\x04 \x01(\t\"x\n\x04\x46ill\x12\x0f\n\x07\x66ill_id\x18\x01 \x01(\t\x12\x14\n\x0c\x62uy_order_id\x18\x02 \x01(\t\x12\x15\n\rsell_order_id\x18\x03 \x01(\t\x12\r\n\x05price\x18\x04 \x01(\x01\x12\x10\n\x08quantity\x18\x05 \x01(\x01\x12\x11\n\ttimestamp\x18\x06 \x01(\x03\"7\n\x12\x43\x61ncelOrderRequest\x12\x10\n\x08order_id\x18\x01 \x01(\t\x12\x0f\n\x07user_id\x18\x02 \x01(\t\"N\n\x13\x43\x61ncelOrderResponse\x12\x10\n\x08order_id\x18\x01 \x01(\t\x12\x0e\n\x06status\x18\x02 \x01(\t\x12\x15\n\rerror_message\x18\x03 \x01(\t\"0\n\x0bSyncRequest\x12\x0e\n\x06symbol\x18\x01 \x01(\t\x12\x11\n\tengine_id\x18\x02 \x01(\t\"\xb5\x01\n\x0fOrderBookUpdate\x12\x0e\n\x06symbol\x18\x01 \x01(\t\x12\"\n\x04\x62ids\x18\x02 \x03(\x0b\x32\x14.matching.PriceLevel\x12\"\n\x04\x61sks\x18\x03 \x03(\x0b\x32\x14.matching.PriceLevel\x12\x17\n\x0fsequence_number\x18\x04 \x01(\x03\x12\x11\n\tengine_id\x18\x05 \x01(\t\x12\r\n\x05\x64\x65lta\x18\x06 \x01(\x08\x12\x0f\n\x07\x61\x64\x64ress\x18\x07 \x01(\t\"B\n\x14\x42\x61tchOrderBookUpdate\x12*\n\x07updates\x18\x01 \x03(\x0b\x32\x19.matching.OrderBookUpdate\"B\n\nPriceLevel\x12\r\n\x05price\x18\x01 \x01(\x01\x12\x10\n\x08quantity\x18\x02 \x01(\x01\x12\x13\n\x0border_count\x18\x03 \x01(\x05\"%\n\x13GetOrderBookRequest\x12\x0e\n\x06symbol\x18\x01 \x01(\t\"v\n\tOrderBook\x12\x0e\n\x06symbol\x18\x01 \x01(\t\x12\"\n\x04\x62ids\x18\x02 \x03(\x0b\x32\x14.matching.PriceLevel\x12\"\n\x04\x61sks\x18\x03 \x03(\x0b\x32\x14.matching.PriceLevel\x12\x11\n\ttimestamp\x18\x04 \x01(\x03\"o\n\x15GlobalBestPriceUpdate\x12\x0e\n\x06symbol\x18\x01 \x01(\t\x12\x10\n\x08\x62\x65st_bid\x18\x02 \x01(\x01\x12\x10\n\x08\x62\x65st_ask\x18\x03 \x01(\x01\x12\x11\n\tengine_id\x18\x04 \x01(\t\x12\x0f\n\x07\x61\x64\x64ress\x18\x05 \x01(\t2\x8a\x04\n\x0fMatchingService\x12=\n\x0bSubmitOrder\x12\x0f.matching.Order\x1a\x1d.matching.SubmitOrderResponse\x12\x42\n\x0cSubmitOrders\x12\x0f.matching.Order\x1a\x1d.matching.SubmitOrderResponse(\x01\x30\x01\x12J\n\x0b\x43\x61ncelOrder\x12\x1c.matching.CancelOrderRequest\x1a\x1d.matching.CancelOrderResponse\x12\x43\n\rSyncOrderBook\x12\x15.matching.SyncRequest\x1a\x19.matching.OrderBookUpdate0\x01\x12O\n\x13SyncOrderBookStream\x12\x1e.matching.BatchOrderBookUpdate\x1a\x16.google.protobuf.Empty(\x01\x12\x42\n\x0cGetOrderBook\x12\x1d.matching.GetOrderBookRequest\x1a\x13.matching.OrderBook\x12N\n\x13SyncGlobalBestPrice\x12\x1f.matching.GlobalBestPriceUpdate\x1a\x16.google.protobuf.Emptyb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -47,15 +47,17 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_SYNCREQUEST']._serialized_start=567
   _globals['_SYNCREQUEST']._serialized_end=615
   _globals['_ORDERBOOKUPDATE']._serialized_start=618
-  _globals['_ORDERBOOKUPDATE']._serialized_end=767
-  _globals['_PRICELEVEL']._serialized_start=769
-  _globals['_PRICELEVEL']._serialized_end=835
-  _globals['_GETORDERBOOKREQUEST']._serialized_start=837
-  _globals['_GETORDERBOOKREQUEST']._serialized_end=874
-  _globals['_ORDERBOOK']._serialized_start=876
-  _globals['_ORDERBOOK']._serialized_end=994
-  _globals['_GLOBALBESTPRICEUPDATE']._serialized_start=996
-  _globals['_GLOBALBESTPRICEUPDATE']._serialized_end=1090
-  _globals['_MATCHINGSERVICE']._serialized_start=1093
-  _globals['_MATCHINGSERVICE']._serialized_end=1466
+  _globals['_ORDERBOOKUPDATE']._serialized_end=799
+  _globals['_BATCHORDERBOOKUPDATE']._serialized_start=801
+  _globals['_BATCHORDERBOOKUPDATE']._serialized_end=867
+  _globals['_PRICELEVEL']._serialized_start=869
+  _globals['_PRICELEVEL']._serialized_end=935
+  _globals['_GETORDERBOOKREQUEST']._serialized_start=937
+  _globals['_GETORDERBOOKREQUEST']._serialized_end=974
+  _globals['_ORDERBOOK']._serialized_start=976
+  _globals['_ORDERBOOK']._serialized_end=1094
+  _globals['_GLOBALBESTPRICEUPDATE']._serialized_start=1096
+  _globals['_GLOBALBESTPRICEUPDATE']._serialized_end=1207
+  _globals['_MATCHINGSERVICE']._serialized_start=1210
+  _globals['_MATCHINGSERVICE']._serialized_end=1732
 # @@protoc_insertion_point(module_scope)
@@ -41,6 +41,11 @@ class MatchingServiceStub(object):
                 request_serializer=proto_dot_matching__service__pb2.Order.SerializeToString,
                 response_deserializer=proto_dot_matching__service__pb2.SubmitOrderResponse.FromString,
                 _registered_method=True)
+        self.SubmitOrders = channel.stream_stream(
+                '/matching.MatchingService/SubmitOrders',
+                request_serializer=proto_dot_matching__service__pb2.Order.SerializeToString,
+                response_deserializer=proto_dot_matching__service__pb2.SubmitOrderResponse.FromString,
+                _registered_method=True)
         self.CancelOrder = channel.unary_unary(
                 '/matching.MatchingService/CancelOrder',
                 request_serializer=proto_dot_matching__service__pb2.CancelOrderRequest.SerializeToString,
@@ -51,6 +56,11 @@ class MatchingServiceStub(object):
                 request_serializer=proto_dot_matching__service__pb2.SyncRequest.SerializeToString,
                 response_deserializer=proto_dot_matching__service__pb2.OrderBookUpdate.FromString,
                 _registered_method=True)
+        self.SyncOrderBookStream = channel.stream_unary(
+                '/matching.MatchingService/SyncOrderBookStream',
+                request_serializer=proto_dot_matching__service__pb2.BatchOrderBookUpdate.SerializeToString,
+                response_deserializer=google_dot_protobuf_dot_empty__pb2.Empty.FromString,
+                _registered_method=True)
         self.GetOrderBook = channel.unary_unary(
                 '/matching.MatchingService/GetOrderBook',
                 request_serializer=proto_dot_matching__service__pb2.GetOrderBookRequest.SerializeToString,
@@ -74,6 +84,13 @@ class MatchingServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def SubmitOrders(self, request_iterator, context):
+        """Submit many orders over one long-lived stream, one response per order
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def CancelOrder(self, request, context):
         """Cancel an existing order
         """
@@ -88,6 +105,13 @@ class MatchingServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def SyncOrderBookStream(self, request_iterator, context):
+        """Long-lived push stream of update batches from one peer, kept open for the engine's lifetime
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def GetOrderBook(self, request, context):
         """Get current state of order book
         """
@@ -109,6 +133,11 @@ def add_MatchingServiceServicer_to_server(servicer, server):
                     request_deserializer=proto_dot_matching__service__pb2.Order.FromString,
                     response_serializer=proto_dot_matching__service__pb2.SubmitOrderResponse.SerializeToString,
             ),
+            'SubmitOrders': grpc.stream_stream_rpc_method_handler(
+                    servicer.SubmitOrders,
+                    request_deserializer=proto_dot_matching__service__pb2.Order.FromString,
+                    response_serializer=proto_dot_matching__service__pb2.SubmitOrderResponse.SerializeToString,
+            ),
             'CancelOrder': grpc.unary_unary_rpc_method_handler(
                     servicer.CancelOrder,
                     request_deserializer=proto_dot_matching__service__pb2.CancelOrderRequest.FromString,
@@ -119,6 +148,11 @@ def add_MatchingServiceServicer_to_server(servicer, server):
                     request_deserializer=proto_dot_matching__service__pb2.SyncRequest.FromString,
                     response_serializer=proto_dot_matching__service__pb2.OrderBookUpdate.SerializeToString,
             ),
+            'SyncOrderBookStream': grpc.stream_unary_rpc_method_handler(
+                    servicer.SyncOrderBookStream,
+                    request_deserializer=proto_dot_matching__service__pb2.BatchOrderBookUpdate.FromString,
+                    response_serializer=google_dot_protobuf_dot_empty__pb2.Empty.SerializeToString,
+            ),
             'GetOrderBook': grpc.unary_unary_rpc_method_handler(
                     servicer.GetOrderBook,
                     request_deserializer=proto_dot_matching__service__pb2.GetOrderBookRequest.FromString,
@@ -168,6 +202,33 @@ class MatchingService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def SubmitOrders(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/matching.MatchingService/SubmitOrders',
+            proto_dot_matching__service__pb2.Order.SerializeToString,
+            proto_dot_matching__service__pb2.SubmitOrderResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def CancelOrder(request,
             target,
@@ -222,6 +283,33 @@ class MatchingService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def SyncOrderBookStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(
+            request_iterator,
+            target,
+            '/matching.MatchingService/SyncOrderBookStream',
+            proto_dot_matching__service__pb2.BatchOrderBookUpdate.SerializeToString,
+            google_dot_protobuf_dot_empty__pb2.Empty.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def GetOrderBook(request,
             target,